@@ -1,12 +1,17 @@
 import asyncio
+import atexit
+import collections
+import functools
+import hashlib
 import threading
 import time
 import logging
-import toml
-import pystray
-from PIL import Image, ImageDraw
-import pygetwindow as gw
-import psutil
+import logging.handlers
+import queue
+try:
+    import tomllib # Python 3.11以降は標準ライブラリのパーサーを使う
+except ImportError:
+    import tomli as tomllib
 import os
 import sys
 import subprocess
@@ -14,78 +19,522 @@ import ctypes
 from ctypes import wintypes
 import re
 from screeninfo import get_monitors
-from pyvda import AppView, VirtualDesktop, get_virtual_desktops
+import win32api
 import win32gui
 import win32con
 from pydantic import ValidationError
 
-from settings_model import SettingsModel, MoveTo, ResizeTo
+from settings_model import SettingsModel
 
 # --- 定数 ---
 SETTINGS_FILE = "settings.toml"
 LOG_FILE = "log.txt"
+LOG_BUFFER_CAPACITY = 256 # ファイルへ書き出すまでにメモリに溜めるログレコード数
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(threadName)s: %(message)s"
 ANCHOR_POINTS = {
     "TopLeft": (0.0, 0.0), "TopCenter": (0.5, 0.0), "TopRight": (1.0, 0.0),
     "MiddleLeft": (0.0, 0.5), "MiddleCenter": (0.5, 0.5), "MiddleRight": (1.0, 0.5),
     "BottomLeft": (0.0, 1.0), "BottomCenter": (0.5, 1.0), "BottomRight": (1.0, 1.0)
 }
+DEFAULT_ANCHOR_RATIOS = ANCHOR_POINTS["TopLeft"] # 不明なアンカー名はTopLeftとして扱う
+# 条件のパターンキーと、ログ出力用の表示名
+CONDITION_PATTERN_LABELS = {"title": "タイトル", "process": "プロセス", "class_name": "クラス"}
+# 条件の評価順。取得済みの文字列で判定できるキーを先にし、初回の取得にWin32呼び出しが必要なプロセス名は最後に回す
+CONDITION_CHECK_ORDER = ("title", "class_name", "process")
+VIRTUAL_DESKTOP_COUNT_TTL = 2.0 # 仮想デスクトップ数のキャッシュ有効期間（秒）
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+IMAGE_NAME_BUFFER_SIZE = 1024
+CLASS_NAME_BUFFER_SIZE = 256 # ウィンドウクラス名の最大長
+DISPLAY_CHANGE_WINDOW_CLASS = "WindowMoverDisplayChange"
+PROCESS_NAME_CACHE_SIZE = 256 # (PID, 作成時刻) ごとのプロセス名キャッシュの上限件数
+WINDOW_SETTLE_DELAY = 0.02 # イベント受信からウィンドウ情報を読み取るまでの待機時間（秒）
+WINDOW_SETTLE_ATTEMPTS = 3 # ウィンドウが表示状態・タイトル設定済みになるのを待つ最大試行回数
+STARTUP_SWEEP_DELAY = 1.0 # 起動から既存ウィンドウへのルール適用を始めるまでの待機時間（秒）
+TITLE_CHANGE_SETTLE_DELAY = 0.15 # タイトル変更が続いている間は再評価せず、変更が止まるまで待つ時間（秒）
+# フックで受け取るイベントの、ログ出力用の表示名
+WIN_EVENT_NAMES = {
+    win32con.EVENT_OBJECT_CREATE: "CREATE",
+    win32con.EVENT_OBJECT_DESTROY: "DESTROY",
+    win32con.EVENT_OBJECT_SHOW: "SHOW",
+    win32con.EVENT_OBJECT_NAMECHANGE: "NAMECHANGE",
+}
+
+
+# --- Win32 API (ctypes) ---
+# 呼び出しのたびに属性解決や型変換の推測が起きないよう、関数と引数型を一度だけ解決しておく
+_kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+
+_OpenProcess = _kernel32.OpenProcess
+_OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+_OpenProcess.restype = wintypes.HANDLE
+
+_CloseHandle = _kernel32.CloseHandle
+_CloseHandle.argtypes = (wintypes.HANDLE,)
+_CloseHandle.restype = wintypes.BOOL
+
+_QueryFullProcessImageNameW = _kernel32.QueryFullProcessImageNameW
+_QueryFullProcessImageNameW.argtypes = (wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD))
+_QueryFullProcessImageNameW.restype = wintypes.BOOL
+
+_GetProcessTimes = _kernel32.GetProcessTimes
+_GetProcessTimes.argtypes = (wintypes.HANDLE,) + (ctypes.POINTER(wintypes.FILETIME),) * 4
+_GetProcessTimes.restype = wintypes.BOOL
+
+_user32 = ctypes.WinDLL("user32", use_last_error=True)
+
+WNDENUMPROC = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+
+_EnumWindows = _user32.EnumWindows
+_EnumWindows.argtypes = (WNDENUMPROC, wintypes.LPARAM)
+_EnumWindows.restype = wintypes.BOOL
+
+_IsWindowVisible = _user32.IsWindowVisible
+_IsWindowVisible.argtypes = (wintypes.HWND,)
+_IsWindowVisible.restype = wintypes.BOOL
+
+_IsIconic = _user32.IsIconic
+_IsIconic.argtypes = (wintypes.HWND,)
+_IsIconic.restype = wintypes.BOOL
+
+_IsZoomed = _user32.IsZoomed
+_IsZoomed.argtypes = (wintypes.HWND,)
+_IsZoomed.restype = wintypes.BOOL
+
+_GetWindowTextLengthW = _user32.GetWindowTextLengthW
+_GetWindowTextLengthW.argtypes = (wintypes.HWND,)
+_GetWindowTextLengthW.restype = ctypes.c_int
+
+_GetWindowTextW = _user32.GetWindowTextW
+_GetWindowTextW.argtypes = (wintypes.HWND, wintypes.LPWSTR, ctypes.c_int)
+_GetWindowTextW.restype = ctypes.c_int
+
+_GetClassNameW = _user32.GetClassNameW
+_GetClassNameW.argtypes = (wintypes.HWND, wintypes.LPWSTR, ctypes.c_int)
+_GetClassNameW.restype = ctypes.c_int
+
+_GetWindowRect = _user32.GetWindowRect
+_GetWindowRect.argtypes = (wintypes.HWND, ctypes.POINTER(wintypes.RECT))
+_GetWindowRect.restype = wintypes.BOOL
+
+_SetWindowPos = _user32.SetWindowPos
+_SetWindowPos.argtypes = (wintypes.HWND, wintypes.HWND, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, wintypes.UINT)
+_SetWindowPos.restype = wintypes.BOOL
+
+_GetWindowThreadProcessId = _user32.GetWindowThreadProcessId
+_GetWindowThreadProcessId.argtypes = (wintypes.HWND, ctypes.POINTER(wintypes.DWORD))
+_GetWindowThreadProcessId.restype = wintypes.DWORD
+
+# ルール評価と座標計算で使うウィンドウ情報の読み取り専用スナップショット
+WinSnapshot = collections.namedtuple("WinSnapshot", "hwnd title left top width height")
+# 前処理済みの設定一式。再読み込み時は新しい組を作り、1回の代入で差し替える
+CompiledSettings = collections.namedtuple(
+    "CompiledSettings",
+    "globals rules ignores process_ignores class_ignores rules_by_process residual_rules needs_class_name")
+
+def take_window_snapshot(hwnd) -> WinSnapshot | None:
+    """ウィンドウのタイトルと矩形をまとめて取得する。ウィンドウが無効な場合はNoneを返す"""
+    rect = wintypes.RECT()
+    if not _GetWindowRect(hwnd, ctypes.byref(rect)):
+        return None
+    length = _GetWindowTextLengthW(hwnd)
+    title = ""
+    if length > 0:
+        buffer = ctypes.create_unicode_buffer(length + 1)
+        _GetWindowTextW(hwnd, buffer, length + 1)
+        title = buffer.value
+    return WinSnapshot(hwnd, title, rect.left, rect.top, rect.right - rect.left, rect.bottom - rect.top)
+
+def get_class_name(hwnd) -> str | None:
+    """ウィンドウクラス名を取得する。取得できない場合はNoneを返す"""
+    buffer = ctypes.create_unicode_buffer(CLASS_NAME_BUFFER_SIZE)
+    if not _GetClassNameW(hwnd, buffer, CLASS_NAME_BUFFER_SIZE):
+        return None
+    return buffer.value
+
+def enum_candidate_hwnds(exclude=(), class_matchers=()) -> list[int]:
+    """
+    ルール適用の候補となるトップレベルウィンドウ（表示中・非最小化・タイトルあり）のハンドルを列挙する。
+    絞り込みは列挙のコールバック内で行い、対象外のハンドルはリストにも積まない。exclude に含まれるハンドルも除く。
+    class_matchers にはクラス名だけで判定できる無視ルールの判定関数を渡し、一致したウィンドウを除く。
+    """
+    hwnds = []
+
+    def callback(hwnd, lparam):
+        # Win32呼び出しを伴わない除外チェックを先に行い、安価な順に判定する
+        if hwnd in exclude or not _IsWindowVisible(hwnd) or _IsIconic(hwnd) or not _GetWindowTextLengthW(hwnd):
+            return True
+        if class_matchers:
+            class_name = get_class_name(hwnd)
+            if class_name:
+                class_lower = class_name.lower()
+                for match in class_matchers:
+                    if match(None, None, None, class_name, class_lower):
+                        return True
+        hwnds.append(hwnd)
+        return True
+
+    _EnumWindows(WNDENUMPROC(callback), 0)
+    return hwnds
+
+def enum_top_level_hwnds() -> set[int]:
+    """現在存在するトップレベルウィンドウのハンドルを、1回の EnumWindows でまとめて取得する"""
+    hwnds = set()
+
+    def callback(hwnd, lparam):
+        hwnds.add(hwnd)
+        return True
+
+    _EnumWindows(WNDENUMPROC(callback), 0)
+    return hwnds
+
+def set_window_rect(hwnd, x, y, width, height, move=True, resize=True) -> bool:
+    """
+    1回の SetWindowPos でウィンドウの位置とサイズをまとめて変更する。
+    変更しない要素は SWP_NOMOVE / SWP_NOSIZE で除外し、Zオーダーとアクティブ状態は変えない。
+    """
+    flags = win32con.SWP_NOZORDER | win32con.SWP_NOACTIVATE | win32con.SWP_ASYNCWINDOWPOS
+    if not move:
+        flags |= win32con.SWP_NOMOVE
+    if not resize:
+        flags |= win32con.SWP_NOSIZE
+    return bool(_SetWindowPos(hwnd, None, x, y, width, height, flags))
+
+def get_window_pid(hwnd) -> int:
+    """ウィンドウを所有するプロセスのPIDを返す。取得できない場合は0を返す"""
+    pid = wintypes.DWORD()
+    _GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+    return pid.value
+
+def query_process_start_time(pid: int) -> int | None:
+    """プロセスの作成時刻（FILETIME値）を返す。PIDの再利用を見分けるために使う。取得できない場合はNoneを返す"""
+    handle = _OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return None
+    try:
+        creation, exit_, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not _GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exit_), ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        return (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+    finally:
+        _CloseHandle(handle)
+
+def query_process_image_name(pid: int) -> str | None:
+    """PIDから実行ファイル名（例: notepad.exe）を取得する。取得できない場合はNoneを返す"""
+    handle = _OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return None
+    try:
+        size = wintypes.DWORD(IMAGE_NAME_BUFFER_SIZE)
+        buffer = ctypes.create_unicode_buffer(IMAGE_NAME_BUFFER_SIZE)
+        if not _QueryFullProcessImageNameW(handle, 0, buffer, ctypes.byref(size)):
+            return None
+        return os.path.basename(buffer.value)
+    finally:
+        _CloseHandle(handle)
 
 
 # --- ログレベル変換 ---
+@functools.lru_cache(maxsize=16)
 def get_log_level_from_string(level_str: str) -> int:
     """ログレベルの文字列をloggingの定数に変換する"""
     return getattr(logging, level_str.upper(), logging.INFO)
 
 # --- ロギング設定 ---
+# setup_logging が作成したハンドラー。ログレベルの変更やログのクリアでは、ファイルを開き直さずに使い回す
+_file_handler = None
+_buffered_file_handler = None
+_log_listener = None
+
 def setup_logging(level: int = logging.INFO):
-    """ロギングの基本設定を行う"""
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
-    
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s [%(levelname)s] %(threadName)s: %(message)s",
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8', mode='w'),
-            logging.StreamHandler()
-        ]
-    )
+    """ロギングの基本設定を行う。設定済みの場合はログレベルだけを変更する"""
+    global _file_handler, _buffered_file_handler, _log_listener
+    if _file_handler is not None:
+        logging.root.setLevel(level)
+        return
+
+    # 書式で使わないプロセス情報は、レコードごとに取得しないようにする
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    # ファイルへの書き込みはMemoryHandlerでまとめて行う（WARNING以上は即座に書き出す）
+    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8', mode='w')
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=file_handler)
+    stream_handler = logging.StreamHandler()
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler.setFormatter(formatter)
+    stream_handler.setFormatter(formatter)
+
+    # ログを出すスレッドはキューに積むだけにし、書き込みは QueueListener のスレッドで行う
+    # （QueueHandler はメッセージ本文だけを確定させ、書式はリスナー側のハンドラーで適用する）
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(
+        log_queue, buffered_file_handler, stream_handler, respect_handler_level=True)
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    listener.start()
+    # main() を経由せずに終了した場合も、キューとバッファに残ったログを書き出す（logging.shutdown より先に呼ばれる）
+    atexit.register(shutdown_logging)
+
     logging.getLogger("pyvda").setLevel(logging.INFO)
     logging.getLogger("PIL").setLevel(logging.INFO)
+    _file_handler = file_handler
+    _buffered_file_handler = buffered_file_handler
+    _log_listener = listener
+
+def shutdown_logging():
+    """キューに残っているログを書き出し、ログ出力用のスレッドを停止する"""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    _log_listener = None
+    _buffered_file_handler.flush()
+
+def flush_log_file():
+    """メモリに溜まっているログをファイルへ書き出す"""
+    if _buffered_file_handler is not None:
+        _buffered_file_handler.flush()
+
+def clear_log_file():
+    """ファイルを開き直さずに、ログファイルの内容と書き出し前のバッファを破棄する"""
+    if _file_handler is None:
+        return
+    _buffered_file_handler.acquire()
+    try:
+        _buffered_file_handler.buffer.clear()
+    finally:
+        _buffered_file_handler.release()
+    _file_handler.acquire()
+    try:
+        if _file_handler.stream is not None:
+            _file_handler.stream.seek(0)
+            _file_handler.stream.truncate()
+    finally:
+        _file_handler.release()
+
+# --- 条件マッチング ---
+def _never_match(title, title_lower, get_process, class_name, class_lower):
+    return False
+
+def build_condition_matcher(condition):
+    """
+    単一の条件ブロックを、(title, title_lower, get_process, class_name, class_lower) を受け取る判定関数に変換する。
+    ブロック内に複数の条件（title, processなど）がある場合、それらはANDとして評価される。
+    何も条件が指定されていない、または不正な正規表現を含む場合は、常にFalseを返す。
+    パターンは Settings 読み込み時に前処理済み（正規表現のコンパイル、小文字化）であること。
+    正規表現・大文字小文字の区別による分岐は変換時に済ませ、指定されたキーの判定だけを並べる。
+    """
+    if condition.get("_invalid"):
+        return _never_match
+    checks = [_build_field_check(condition, key) for key in CONDITION_CHECK_ORDER if condition.get(key)]
+    if not checks:
+        return _never_match
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+
+    def match_all_fields(title, title_lower, get_process, class_name, class_lower):
+        for check in checks:
+            if not check(title, title_lower, get_process, class_name, class_lower):
+                return False
+        return True
+    return match_all_fields
+
+def _build_field_check(condition, key):
+    """
+    単一キー（title, process, class_name）の判定関数を返す。
+    タイトルとクラス名は部分一致、プロセス名は完全一致で比較する。
+    get_process は (プロセス名, 小文字化したプロセス名) を返す関数で、プロセス条件を評価するときだけ呼び出される。
+    """
+    pattern = condition[key]
+    compiled = condition.get(f"_{key}_re")
+    case_sensitive = condition.get("case_sensitive", False)
+    lower = condition.get(f"_{key}_lower")
+
+    if key == "title":
+        if compiled is not None:
+            search = compiled.search
+            return lambda title, title_lower, get_process, class_name, class_lower: search(title) is not None
+        if case_sensitive:
+            return lambda title, title_lower, get_process, class_name, class_lower: pattern in title
+        return lambda title, title_lower, get_process, class_name, class_lower: lower in title_lower
+
+    if key == "class_name":
+        if compiled is not None:
+            search = compiled.search
+            return lambda title, title_lower, get_process, class_name, class_lower: bool(class_name) and search(class_name) is not None
+        if case_sensitive:
+            return lambda title, title_lower, get_process, class_name, class_lower: bool(class_name) and pattern in class_name
+        return lambda title, title_lower, get_process, class_name, class_lower: bool(class_name) and lower in class_lower
+
+    if compiled is not None:
+        fullmatch = compiled.fullmatch
+        def check_process(title, title_lower, get_process, class_name, class_lower):
+            process_name, process_lower = get_process()
+            return bool(process_name) and fullmatch(process_name) is not None
+    elif case_sensitive:
+        def check_process(title, title_lower, get_process, class_name, class_lower):
+            process_name, process_lower = get_process()
+            return bool(process_name) and process_name == pattern
+    else:
+        def check_process(title, title_lower, get_process, class_name, class_lower):
+            process_name, process_lower = get_process()
+            return bool(process_name) and process_lower == lower
+    return check_process
+
+def build_matcher(rule_condition):
+    """
+    条件全体（AND/OR）を、(title, title_lower, get_process, class_name, class_lower) を受け取る
+    判定関数に変換する。設定読み込み時に一度だけ呼び出し、イベントごとの辞書の走査を省く。
+    """
+    conditions = rule_condition.get("conditions")
+    if not conditions:
+        return build_condition_matcher(rule_condition)
+
+    is_or = rule_condition.get("logic", "AND").upper() == "OR"
+    combined_matchers = []
+    if is_or:
+        combined_matchers, conditions = _combine_literal_conditions(conditions)
+    # 結果は評価順に依存しないため、プロセス名を使う判定を後ろに回し、取得せずに決着がつく場合を増やす（安定ソート）
+    entries = [(key == "process", matcher) for key, matcher in combined_matchers]
+    entries += [(bool(c.get("process")), build_condition_matcher(c)) for c in conditions]
+    entries.sort(key=lambda entry: entry[0])
+    sub_matchers = tuple(matcher for _, matcher in entries)
+
+    # 条件数が少ない場合はジェネレータを使わずに展開する
+    if len(sub_matchers) == 1:
+        return sub_matchers[0]
+    if len(sub_matchers) == 2:
+        first, second = sub_matchers
+        if is_or:
+            def match_either(title, title_lower, get_process, class_name, class_lower):
+                return (first(title, title_lower, get_process, class_name, class_lower)
+                        or second(title, title_lower, get_process, class_name, class_lower))
+            return match_either
+
+        def match_both(title, title_lower, get_process, class_name, class_lower):
+            return (first(title, title_lower, get_process, class_name, class_lower)
+                    and second(title, title_lower, get_process, class_name, class_lower))
+        return match_both
+
+    if is_or:
+        def match_any(title, title_lower, get_process, class_name, class_lower):
+            for m in sub_matchers:
+                if m(title, title_lower, get_process, class_name, class_lower):
+                    return True
+            return False
+        return match_any
 
-# --- 設定管理 ---
-class Settings:
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.model: SettingsModel = SettingsModel()
-        self.load()
+    def match_all(title, title_lower, get_process, class_name, class_lower):
+        for m in sub_matchers:
+            if not m(title, title_lower, get_process, class_name, class_lower):
+                return False
+        return True
+    return match_all
 
-    def load(self):
-        """設定ファイルを読み込み、Pydanticモデルで検証する"""
-        try:
-            with open(self.filepath, "r", encoding="utf-8") as f:
-                data = toml.load(f)
-            self.model = SettingsModel.model_validate(data)
-            logging.info(f"設定ファイルを読み込み、検証しました。Global: {len(self.model.globals.model_dump())}項目, Ignores: {len(self.model.ignores)}個, Rules: {len(self.model.rules)}個")
-        except FileNotFoundError:
-            logging.warning(f"設定ファイル '{self.filepath}' が見つかりません。デフォルト設定で新しいファイルを生成します。")
-            self._create_default_settings_file()
-            self.model = SettingsModel() # 生成後はデフォルト設定で動作
-        except toml.TomlDecodeError as e:
-            logging.error(f"設定ファイル '{self.filepath}' の形式が正しくありません (行: {e.lineno}, 列: {e.colno}): {e}")
-            self.model = SettingsModel()
-        except ValidationError as e:
-            logging.error(f"設定ファイル '{self.filepath}' のバリデーションに失敗しました:")
-            for error in e.errors():
-                logging.error(f"  -場所: {' -> '.join(map(str, error['loc']))}, エラー: {error['msg']}")
-            self.model = SettingsModel()
-        except Exception as e:
-            logging.error(f"設定ファイルの読み込み中に予期せぬエラーが発生しました: {e}", exc_info=True)
-            self.model = SettingsModel()
+def _literal_condition_key(condition):
+    """大文字・小文字を区別しないリテラルのパターンを1つだけ持つ条件であれば、そのキーを返す（それ以外はNone）"""
+    if condition.get("case_sensitive", False) or condition.get("_invalid"):
+        return None
+    keys = [key for key in CONDITION_PATTERN_LABELS if condition.get(key)]
+    if len(keys) != 1 or condition.get(f"_{keys[0]}_re") is not None:
+        return None
+    return keys[0]
+
+def _combine_literal_conditions(conditions):
+    """
+    OR条件のうち、同じキーに対するリテラル条件が複数あれば、キーごとに1つの判定にまとめる。
+    プロセス名は集合の所属判定に、タイトルとクラス名（部分一致）は1つの正規表現にまとめる。
+    各ウィンドウで条件ごとに比較する代わりに、1回の検索で判定できるようにする。
+    ([(キー, まとめた判定関数)], まとめなかった条件のリスト) を返す。
+    """
+    literals = {}
+    for condition in conditions:
+        key = _literal_condition_key(condition)
+        if key is not None:
+            literals.setdefault(key, []).append(condition)
+
+    combined_keys = {key for key, group in literals.items() if len(group) > 1}
+    if not combined_keys:
+        return [], conditions
+
+    matchers = []
+    for key in CONDITION_CHECK_ORDER:
+        if key not in combined_keys:
+            continue
+        group = literals[key]
+        if key == "process":
+            # プロセス名は完全一致で比較するため、正規表現ではなく集合の所属判定で済ませる
+            names = frozenset(c["_process_lower"] for c in group)
+            def match_processes(title, title_lower, get_process, class_name, class_lower, names=names):
+                process_name, process_lower = get_process()
+                return bool(process_name) and process_lower in names
+            matchers.append((key, match_processes))
+            continue
+        # タイトルとクラス名は部分一致のため、1つの正規表現にまとめる
+        alternation = "|".join(re.escape(c[f"_{key}_lower"]) for c in group)
+        if key == "title":
+            search = re.compile(alternation).search
+            def match_titles(title, title_lower, get_process, class_name, class_lower, search=search):
+                return search(title_lower) is not None
+            matchers.append((key, match_titles))
+        else:
+            search = re.compile(alternation).search
+            def match_classes(title, title_lower, get_process, class_name, class_lower, search=search):
+                return bool(class_name) and search(class_lower) is not None
+            matchers.append((key, match_classes))
+
+    remaining = [c for c in conditions if _literal_condition_key(c) not in combined_keys]
+    return matchers, remaining
+
+def _is_single_key_condition(condition, key):
+    """単一条件が指定キー（title, process, class_name のいずれか）だけを指定しているかを返す"""
+    return all(bool(condition.get(k)) == (k == key) for k in CONDITION_PATTERN_LABELS)
+
+def _build_single_key_matcher(rule_condition, key):
+    """
+    条件ブロックのうち、指定キーだけで一致を確定できる部分の判定関数を返す（該当する部分がなければNone）。
+    OR条件では指定キーのみの条件を抜き出し、AND条件ではすべてが指定キーのみの場合に限り全体を使う。
+    """
+    conditions = rule_condition.get("conditions")
+    if not conditions:
+        return build_matcher(rule_condition) if _is_single_key_condition(rule_condition, key) else None
+
+    key_only = [c for c in conditions if _is_single_key_condition(c, key)]
+    if rule_condition.get("logic", "AND").upper() == "OR":
+        return build_matcher({"conditions": key_only, "logic": "OR"}) if key_only else None
+    return build_matcher(rule_condition) if len(key_only) == len(conditions) else None
+
+def build_process_matcher(rule_condition):
+    """条件ブロックのうち、プロセス名だけで一致を確定できる部分の判定関数を返す（該当する部分がなければNone）"""
+    return _build_single_key_matcher(rule_condition, "process")
+
+def build_class_matcher(rule_condition):
+    """条件ブロックのうち、クラス名だけで一致を確定できる部分の判定関数を返す（該当する部分がなければNone）"""
+    return _build_single_key_matcher(rule_condition, "class_name")
+
+def uses_condition_key(rule_condition, key):
+    """条件ブロックのいずれかの条件が、指定キー（title, process, class_name）を使っているかを返す"""
+    conditions = rule_condition.get("conditions") or (rule_condition,)
+    return any(condition.get(key) for condition in conditions)
+
+def required_process_key(rule_condition):
+    """条件ブロックの一致に必須となるリテラル（正規表現でない）のプロセス名を小文字で返す。なければNone"""
+    conditions = rule_condition.get("conditions")
+    if not conditions:
+        conditions = (rule_condition,)
+    elif len(conditions) > 1 and rule_condition.get("logic", "AND").upper() == "OR":
+        return None
 
-    def _create_default_settings_file(self):
-        """デフォルトの設定ファイルを作成する"""
-        default_content = """
+    for condition in conditions:
+        if condition.get("process") and not condition.get("_invalid") and condition.get("_process_re") is None:
+            return condition["process"].lower()
+    return None
+
+# --- デフォルト設定ファイル ---
+DEFAULT_SETTINGS_TOML = """
 #==============================================================================
 # Window Mover 設定ファイル
 #
@@ -262,130 +711,379 @@ class Settings:
     move_to = "MiddleCenter"
 
 """
+
+# --- 設定管理 ---
+class Settings:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.model: SettingsModel = SettingsModel()
+        self._file_stat = None # 最後に正常に読み込んだファイルの (更新時刻, サイズ)
+        self._file_digest = None # 最後に正常に読み込んだファイル内容のハッシュ
+        self._compiled: CompiledSettings | None = None
+        self.load()
+
+    def load(self):
+        """設定ファイルを読み込み、Pydanticモデルで検証する。ファイルに変更がなければ再解析せずFalseを返す"""
+        try:
+            stat = os.stat(self.filepath)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_stat = None
+        if file_stat is not None and file_stat == self._file_stat:
+            logging.info("設定ファイルに変更がないため、再解析をスキップします。")
+            return False
+        self._file_stat = None
+        previous_digest, self._file_digest = self._file_digest, None
+        previous_model = self.model
+
+        try:
+            with open(self.filepath, "rb") as f:
+                content = f.read()
+            # 保存し直しただけなど、更新時刻が変わっても内容が同じであれば再解析しない
+            digest = hashlib.blake2b(content, digest_size=16).digest()
+            if digest == previous_digest:
+                self._file_stat = file_stat
+                self._file_digest = digest
+                logging.info("設定ファイルの内容に変更がないため、再解析をスキップします。")
+                return False
+            self.model = SettingsModel.model_validate(tomllib.loads(content.decode("utf-8")))
+            self._file_stat = file_stat
+            self._file_digest = digest
+            logging.info(f"設定ファイルを読み込み、検証しました。Global: {len(self.model.globals.model_dump())}項目, Ignores: {len(self.model.ignores)}個, Rules: {len(self.model.rules)}個")
+        except FileNotFoundError:
+            logging.warning(f"設定ファイル '{self.filepath}' が見つかりません。デフォルト設定で新しいファイルを生成します。")
+            self._create_default_settings_file()
+            self.model = SettingsModel() # 生成後はデフォルト設定で動作
+        except tomllib.TOMLDecodeError as e:
+            logging.error(f"設定ファイル '{self.filepath}' の形式が正しくありません: {e}")
+            self.model = SettingsModel()
+        except ValidationError as e:
+            logging.error(f"設定ファイル '{self.filepath}' のバリデーションに失敗しました:")
+            for error in e.errors():
+                logging.error(f"  -場所: {' -> '.join(map(str, error['loc']))}, エラー: {error['msg']}")
+            self.model = SettingsModel()
+        except Exception as e:
+            logging.error(f"設定ファイルの読み込み中に予期せぬエラーが発生しました: {e}", exc_info=True)
+            self.model = SettingsModel()
+
+        previous = self._compiled
+        # イベントごとに参照されるため、辞書への変換は読み込み時に一度だけ行う
+        globals_ = self.model.globals.model_dump()
+        # 変更のなかったセクションは前処理済みの結果をそのまま使い、変更されたセクションだけ作り直す
+        if previous is None or self.model.ignores != previous_model.ignores:
+            ignores = [ignore.model_dump() for ignore in self.model.ignores]
+            process_ignores, class_ignores = self._compile_ignores(ignores)
+        else:
+            logging.debug("無視ルールに変更がないため、前処理を省略します。")
+            ignores, process_ignores, class_ignores = previous.ignores, previous.process_ignores, previous.class_ignores
+        if previous is None or self.model.rules != previous_model.rules:
+            rules = [rule.model_dump() for rule in self.model.rules]
+            rules_by_process, residual_rules = self._compile_rules(rules)
+            self._prepare_actions(rules)
+        else:
+            logging.debug("ルールに変更がないため、前処理を省略します。")
+            rules, rules_by_process, residual_rules = previous.rules, previous.rules_by_process, previous.residual_rules
+        needs_class_name = (
+            any(uses_condition_key(rule.get("condition", {}), "class_name") for rule in rules)
+            or any(uses_condition_key(ignore, "class_name") for ignore in ignores))
+        # イベント処理側が新旧の混ざった状態を見ないよう、すべて揃えてから一度に差し替える
+        self._compiled = CompiledSettings(
+            globals_, rules, ignores, process_ignores, class_ignores, rules_by_process, residual_rules, needs_class_name)
+        return True
+
+    def _prepare_actions(self, rules):
+        """ルールのアクションを前処理し、アンカー名の比率やサイズ指定を数値に解決しておく"""
+        for rule in rules:
+            action = rule.get("action", {})
+            action["_anchor_ratios"] = ANCHOR_POINTS.get(action.get("anchor", "TopLeft"), DEFAULT_ANCHOR_RATIOS)
+            move_to = action.get("move_to")
+            if isinstance(move_to, str):
+                action["_move_to_ratios"] = ANCHOR_POINTS.get(move_to, DEFAULT_ANCHOR_RATIOS)
+            action["_is_absolute_move"] = isinstance(move_to, dict)
+            offset = action.get("offset") or {}
+            action["_offset_xy"] = (offset.get("x", 0), offset.get("y", 0))
+
+            # move_to の座標や resize_to の "800px" / "40%" などの値は、ここで (種別, 数値) の組に解析しておく
+            if isinstance(move_to, dict):
+                self._prepare_values(move_to, ("x", "y"))
+            resize_to = action.get("resize_to")
+            if resize_to:
+                self._prepare_values(resize_to, ("width", "height"))
+
+    @staticmethod
+    def _prepare_values(values, keys):
+        """指定キーの値を解析し、`_<キー>_value` に ("px", 整数) または ("pct", 割合) として格納する"""
+        for key in keys:
+            parsed = parse_size_value(values.get(key))
+            if parsed is not None:
+                values[f"_{key}_value"] = parsed
+
+    def _compile_rules(self, rules):
+        """
+        ルールの条件を前処理し、正規表現のコンパイルや小文字化を読み込み時に済ませる。
+        (プロセス名ごとの索引, 索引に載らないルール) を返す
+        """
+        for rule in rules:
+            condition = rule.get("condition", {})
+            self._compile_condition_block(condition)
+            rule["_match_fn"] = build_matcher(condition)
+        return self._index_rules_by_process(rules)
+
+    def _compile_ignores(self, ignores):
+        """
+        無視ルールの条件を前処理し、正規表現のコンパイルや小文字化を読み込み時に済ませる。
+        (プロセス名で判定できる無視ルール, クラス名で判定できる無視ルール) を返す
+        """
+        for ignore in ignores:
+            self._compile_condition_block(ignore)
+            ignore["_match_fn"] = build_matcher(ignore)
+            ignore["_process_match_fn"] = build_process_matcher(ignore)
+            ignore["_class_match_fn"] = build_class_matcher(ignore)
+        # タイトルやクラス名を取得する前に、プロセス名だけで判定できる無視ルール
+        process_ignores = [ignore for ignore in ignores if ignore["_process_match_fn"] is not None]
+        # 既存ウィンドウの列挙時に、クラス名だけで除外できる無視ルール
+        class_ignores = [ignore for ignore in ignores if ignore["_class_match_fn"] is not None]
+        return process_ignores, class_ignores
+
+    @staticmethod
+    def _index_rules_by_process(rules):
+        """
+        リテラルのプロセス名を必須とするルールをプロセス名ごとに索引する。
+        各索引には、そのプロセスで一致し得るルールだけを元の順序のまま格納し、最初に一致したルールを採用する挙動を保つ。
+        """
+        rule_keys = [required_process_key(rule.get("condition", {})) for rule in rules]
+        residual_rules = [rule for rule, key in zip(rules, rule_keys) if key is None]
+        rules_by_process = {
+            process_key: [rule for rule, key in zip(rules, rule_keys) if key is None or key == process_key]
+            for process_key in set(rule_keys) if process_key is not None
+        }
+        return rules_by_process, residual_rules
+
+    def _compile_condition_block(self, rule_condition):
+        """条件ブロック（単一条件、またはconditionsリスト）を前処理する"""
+        conditions = rule_condition.get("conditions")
+        if not conditions:
+            self._compile_single_condition(rule_condition)
+            return
+        for condition in conditions:
+            self._compile_single_condition(condition)
+
+    def _compile_single_condition(self, condition):
+        """
+        単一条件内の各パターンを前処理する。
+        "regex:"で始まるパターンは re.Pattern として `_<キー>_re` に、
+        大文字・小文字を区別しない文字列パターンは小文字化して `_<キー>_lower` に格納する。
+        不正な正規表現を含む条件は `_invalid` として記録し、常に不一致として扱う。
+        """
+        case_sensitive = condition.get("case_sensitive", False)
+        flags = 0 if case_sensitive else re.IGNORECASE
+        for key, label in CONDITION_PATTERN_LABELS.items():
+            pattern = condition.get(key)
+            if not pattern:
+                continue
+            if pattern.startswith("regex:"):
+                try:
+                    condition[f"_{key}_re"] = re.compile(pattern.replace("regex:", "", 1), flags)
+                except re.error as e:
+                    logging.warning(f'{label}条件の正規表現 "{pattern}" が不正です: {e}')
+                    condition["_invalid"] = True
+            elif not case_sensitive:
+                condition[f"_{key}_lower"] = pattern.lower()
+
+    def _create_default_settings_file(self):
+        """デフォルトの設定ファイルを作成する"""
         try:
             with open(self.filepath, "w", encoding="utf-8") as f:
-                f.write(default_content)
+                f.write(DEFAULT_SETTINGS_TOML)
             logging.info(f"デフォルトの設定ファイルを '{self.filepath}' に生成しました。")
         except Exception as e:
             logging.error(f"デフォルト設定ファイルの生成に失敗しました: {e}", exc_info=True)
 
+    @property
+    def compiled(self) -> CompiledSettings:
+        """前処理済みの設定一式。複数の項目を参照する場合は、これを一度だけ取得して使う"""
+        return self._compiled
+
     @property
     def globals(self):
-        return self.model.globals.model_dump()
+        return self._compiled.globals
 
     @property
     def rules(self):
-        return [rule.model_dump() for rule in self.model.rules]
+        return self._compiled.rules
 
     @property
     def ignores(self):
-        return [ignore.model_dump() for ignore in self.model.ignores]
+        return self._compiled.ignores
+
+    @property
+    def process_ignores(self):
+        return self._compiled.process_ignores
+
+    @property
+    def needs_class_name(self):
+        return self._compiled.needs_class_name
+
+    @property
+    def class_ignores(self):
+        return self._compiled.class_ignores
+
+    @property
+    def rules_by_process(self):
+        return self._compiled.rules_by_process
+
+    @property
+    def residual_rules(self):
+        return self._compiled.residual_rules
 
 # --- 座標計算 ---
+@functools.lru_cache(maxsize=128)
+def parse_size_value(value):
+    """
+    サイズや座標の指定値を ("px", int) または ("pct", float) に分解する。
+    数値と "800px" / "800" はピクセル、"40%" はパーセンテージとして扱い、解析できない場合はNoneを返す。
+    """
+    if isinstance(value, (int, float)):
+        return ("px", int(value))
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            if value.endswith('%'):
+                return ("pct", float(value.strip('%')))
+            if value.endswith('px'):
+                return ("px", int(value.strip('px')))
+            return ("px", int(value))
+        except (ValueError, TypeError):
+            return None
+    return None
+
 class Calculator:
     def __init__(self, monitors, global_settings):
         self.monitors = monitors
         self.globals = global_settings
+        # 座標計算ではモニターオブジェクトの属性参照を避け、事前に展開したタプルを使う
+        self._mon_xywh = [(m.x, m.y, m.width, m.height) for m in monitors]
+        self._mon_ids = [f"monitor_{i + 1}" for i in range(len(monitors))]
+        # モニター判定用の (left, top, right, bottom)。判定のたびに右端・下端を足し算しないよう事前に計算しておく
+        self._mon_bounds = tuple((x, y, x + w, y + h) for x, y, w, h in self._mon_xywh)
+        # ウィンドウハンドル -> (left, top, width, height, モニター番号) のキャッシュ
+        self._window_monitor_cache = {}
+        # モニターIDごとの (top, bottom, left, right) オフセットを事前に解決しておく
+        offsets = self.globals.get("monitor_offsets", {})
+        self._default_offset = self._offset_tuple(offsets.get("default", {}))
+        self._offset_by_monitor = {
+            monitor_id: self._offset_tuple(offset)
+            for monitor_id, offset in offsets.items() if monitor_id != "default"
+        }
+        # オフセット適用後の作業領域 (x, y, width, height) をモニターごとに事前計算しておく
+        self._offset_work_areas = []
+        for monitor_id, (mon_x, mon_y, mon_width, mon_height) in zip(self._mon_ids, self._mon_xywh):
+            offset_top, offset_bottom, offset_left, offset_right = self._offset_by_monitor.get(monitor_id, self._default_offset)
+            self._offset_work_areas.append((
+                mon_x + offset_left, mon_y + offset_top,
+                mon_width - offset_left - offset_right, mon_height - offset_top - offset_bottom))
         logging.debug(f"Calculatorを初期化しました。モニター数: {len(monitors)}")
 
+    @staticmethod
+    def _offset_tuple(offset):
+        """オフセット設定の辞書を (top, bottom, left, right) のタプルに変換する"""
+        return (offset.get("top", 0), offset.get("bottom", 0), offset.get("left", 0), offset.get("right", 0))
+
     def _parse_value(self, value, base_pixels):
         """サイズや座標の値をピクセル単位に変換する"""
-        if isinstance(value, (int, float)):
-            return int(value)
-        if isinstance(value, str):
-            try:
-                value = value.strip()
-                if value.endswith('%'):
-                    return int(base_pixels * float(value.strip('%')) / 100)
-                if value.endswith('px'):
-                    return int(value.strip('px'))
-                return int(value)
-            except (ValueError, TypeError) as e:
-                logging.warning(f'値 "{value}" の解析に失敗しました: {e}。Noneを返します。')
-                return None
-        return None
+        parsed = parse_size_value(value)
+        if parsed is None:
+            if isinstance(value, str):
+                logging.warning(f'値 "{value}" の解析に失敗しました。Noneを返します。')
+            return None
+        kind, number = parsed
+        if kind == "pct":
+            return int(base_pixels * number / 100)
+        return number
+
+    def _resolve_value(self, values, key, base_pixels):
+        """move_to / resize_to の値をピクセルに変換する。読み込み時に解析済みであれば、その (種別, 数値) の組を使う"""
+        parsed = values.get(f"_{key}_value")
+        if parsed is None:
+            return self._parse_value(values.get(key), base_pixels)
+        kind, number = parsed
+        if kind == "pct":
+            return int(base_pixels * number / 100)
+        return number
 
     def _get_target_monitor(self, rule_action, window):
-        """ルールとウィンドウ情報に基づき、ターゲットモニターを決定する"""
+        """ルールとウィンドウ情報に基づき、ターゲットモニターとそのインデックスを決定する"""
         target_monitor_num = rule_action.get("target_monitor")
         if target_monitor_num is not None:
             if isinstance(target_monitor_num, int) and 1 <= target_monitor_num <= len(self.monitors):
-                monitor = self.monitors[target_monitor_num - 1]
-                logging.debug(f"ルール指定により、ターゲットモニター {target_monitor_num} を使用します。")
-                return monitor
+                monitor_idx = target_monitor_num - 1
+                logging.debug("ルール指定により、ターゲットモニター %s を使用します。", target_monitor_num)
+                return self.monitors[monitor_idx], monitor_idx
             else:
                 logging.warning(f"指定されたターゲットモニター番号 '{target_monitor_num}' は無効です（有効範囲: 1～{len(self.monitors)}）。フォールバックしてモニターを自動検出します。")
         
         return self.get_window_monitor(window)
 
-    def _get_work_area(self, monitor, is_absolute_move):
-        """モニターの作業領域を計算する"""
-        monitor_idx = self.monitors.index(monitor)
-        monitor_id = f"monitor_{monitor_idx + 1}"
-        logging.debug(f"対象モニター: {monitor_id} ({monitor.width}x{monitor.height} at ({monitor.x},{monitor.y}))")
-
-        offsets = self.globals.get("monitor_offsets", {})
-        g_offset = {}
-        if not is_absolute_move:
-            g_offset = offsets.get(monitor_id, offsets.get("default", {}))
-            logging.debug(f"グローバルオフセットを適用します: {g_offset}")
-
-        offset_top = g_offset.get("top", 0)
-        offset_bottom = g_offset.get("bottom", 0)
-        offset_left = g_offset.get("left", 0)
-        offset_right = g_offset.get("right", 0)
-
-        work_area_x = monitor.x + offset_left
-        work_area_y = monitor.y + offset_top
-        work_area_width = monitor.width - offset_left - offset_right
-        work_area_height = monitor.height - offset_top - offset_bottom
-        logging.debug(f"作業領域: {work_area_width}x{work_area_height} at ({work_area_x},{work_area_y})")
-        return work_area_x, work_area_y, work_area_width, work_area_height
+    def _get_work_area(self, monitor_idx, is_absolute_move):
+        """モニターの作業領域を返す。絶対座標指定の場合はオフセットを適用しないモニター全体を使う"""
+        if is_absolute_move:
+            work_area = self._mon_xywh[monitor_idx]
+        else:
+            work_area = self._offset_work_areas[monitor_idx]
+        logging.debug("対象モニター: %s, 作業領域: %sx%s at (%s,%s)",
+                      self._mon_ids[monitor_idx], work_area[2], work_area[3], work_area[0], work_area[1])
+        return work_area
 
     def _calculate_new_size(self, resize_to, work_area_width, work_area_height, window):
         """新しいウィンドウサイズを計算する"""
-        w_val = resize_to.get("width")
-        h_val = resize_to.get("height")
-        width = self._parse_value(w_val, work_area_width) if w_val is not None else window.width
-        height = self._parse_value(h_val, work_area_height) if h_val is not None else window.height
+        width = self._resolve_value(resize_to, "width", work_area_width) if resize_to.get("width") is not None else window.width
+        height = self._resolve_value(resize_to, "height", work_area_height) if resize_to.get("height") is not None else window.height
         if width is None or height is None:
             logging.warning("サイズ指定の解析に失敗したため、現在のサイズを維持します。")
             width = window.width if width is None else width
             height = window.height if height is None else height
         return width, height
 
-    def _calculate_new_position(self, move_to, work_area_x, work_area_y, work_area_width, work_area_height, monitor):
+    def _calculate_new_position(self, move_to, work_area_x, work_area_y, work_area_width, work_area_height, monitor_idx, move_to_ratios=None):
         """新しいウィンドウの基準位置を計算する"""
         base_x, base_y = None, None
         if isinstance(move_to, str):
             target_anchor_name = move_to
-            target_x_ratio, target_y_ratio = ANCHOR_POINTS.get(target_anchor_name, (0.0, 0.0))
+            if move_to_ratios is None:
+                move_to_ratios = ANCHOR_POINTS.get(target_anchor_name, DEFAULT_ANCHOR_RATIOS)
+            target_x_ratio, target_y_ratio = move_to_ratios
             base_x = work_area_x + int(work_area_width * target_x_ratio)
             base_y = work_area_y + int(work_area_height * target_y_ratio)
-            logging.debug(f"移動先アンカー '{target_anchor_name}' -> ベース座標 ({base_x}, {base_y})")
+            logging.debug("移動先アンカー '%s' -> ベース座標 (%s, %s)", target_anchor_name, base_x, base_y)
         elif isinstance(move_to, dict):
-            abs_x_val = move_to.get("x")
-            abs_y_val = move_to.get("y")
-            abs_x = self._parse_value(abs_x_val, monitor.width)
-            abs_y = self._parse_value(abs_y_val, monitor.height)
-            if abs_x is not None: base_x = monitor.x + abs_x
-            if abs_y is not None: base_y = monitor.y + abs_y
-            logging.debug(f"絶対/相対座標 {move_to} -> ベース座標 ({base_x}, {base_y})")
+            mon_x, mon_y, mon_width, mon_height = self._mon_xywh[monitor_idx]
+            abs_x = self._resolve_value(move_to, "x", mon_width)
+            abs_y = self._resolve_value(move_to, "y", mon_height)
+            if abs_x is not None: base_x = mon_x + abs_x
+            if abs_y is not None: base_y = mon_y + abs_y
+            logging.debug("絶対/相対座標 (%s, %s) -> ベース座標 (%s, %s)", move_to.get("x"), move_to.get("y"), base_x, base_y)
         return base_x, base_y
 
     def get_target_rect(self, rule_action, window):
         """ルールとウィンドウ情報に基づき、最終的な座標とサイズ (x, y, w, h) を計算する"""
+        if not rule_action.get("move_to") and not rule_action.get("resize_to"):
+            # 移動もリサイズも指定がなければ、target_monitor や offset があっても結果は現在の位置とサイズになる
+            return window.left, window.top, window.width, window.height
         try:
-            monitor = self._get_target_monitor(rule_action, window)
-            is_absolute_move = isinstance(rule_action.get("move_to"), dict)
+            _, monitor_idx = self._get_target_monitor(rule_action, window)
+            is_absolute_move = rule_action.get("_is_absolute_move")
+            if is_absolute_move is None:
+                is_absolute_move = isinstance(rule_action.get("move_to"), dict)
             
-            work_area_x, work_area_y, work_area_width, work_area_height = self._get_work_area(monitor, is_absolute_move)
+            work_area_x, work_area_y, work_area_width, work_area_height = self._get_work_area(monitor_idx, is_absolute_move)
 
             resize_to = rule_action.get("resize_to") or {}
             width, height = self._calculate_new_size(resize_to, work_area_width, work_area_height, window)
 
             move_to = rule_action.get("move_to")
-            base_x, base_y = self._calculate_new_position(move_to, work_area_x, work_area_y, work_area_width, work_area_height, monitor)
+            base_x, base_y = self._calculate_new_position(
+                move_to, work_area_x, work_area_y, work_area_width, work_area_height, monitor_idx,
+                rule_action.get("_move_to_ratios"))
 
             if base_x is None and base_y is None:
                 logging.debug("移動指定がないため、現在の位置を基準とします。")
@@ -395,19 +1093,24 @@ class Calculator:
             final_y = base_y if base_y is not None else window.top
 
             anchor_name = rule_action.get("anchor", "TopLeft")
-            anchor_x_ratio, anchor_y_ratio = ANCHOR_POINTS.get(anchor_name, (0.0, 0.0))
-            logging.debug(f"ウィンドウのアンカー: {anchor_name} ({anchor_x_ratio}, {anchor_y_ratio})")
+            anchor_ratios = rule_action.get("_anchor_ratios")
+            if anchor_ratios is None:
+                anchor_ratios = ANCHOR_POINTS.get(anchor_name, DEFAULT_ANCHOR_RATIOS)
+            anchor_x_ratio, anchor_y_ratio = anchor_ratios
+            logging.debug("ウィンドウのアンカー: %s (%s, %s)", anchor_name, anchor_x_ratio, anchor_y_ratio)
             final_x -= int(width * anchor_x_ratio)
             final_y -= int(height * anchor_y_ratio)
-            logging.debug(f"ウィンドウアンカー適用後 -> ({final_x}, {final_y})")
+            logging.debug("ウィンドウアンカー適用後 -> (%s, %s)", final_x, final_y)
 
-            rule_offset = rule_action.get("offset") or {}
-            offset_x = rule_offset.get("x", 0)
-            offset_y = rule_offset.get("y", 0)
+            offset_xy = rule_action.get("_offset_xy")
+            if offset_xy is None:
+                rule_offset = rule_action.get("offset") or {}
+                offset_xy = (rule_offset.get("x", 0), rule_offset.get("y", 0))
+            offset_x, offset_y = offset_xy
             if offset_x != 0 or offset_y != 0:
                 final_x += offset_x
                 final_y += offset_y
-                logging.debug(f"ルールオフセット適用後 -> ({final_x}, {final_y})")
+                logging.debug("ルールオフセット適用後 -> (%s, %s)", final_x, final_y)
 
             return final_x, final_y, width, height
         except Exception as e:
@@ -415,19 +1118,36 @@ class Calculator:
             return window.left, window.top, window.width, window.height
 
     def get_window_monitor(self, window):
-        """ウィンドウの中心が含まれるモニターを返す"""
+        """ウィンドウの中心が含まれるモニターとそのインデックスを返す。位置とサイズが前回と同じならキャッシュを使う"""
         try:
-            win_center_x = window.left + window.width / 2
-            win_center_y = window.top + window.height / 2
-            for i, m in enumerate(self.monitors):
-                if m.x <= win_center_x < m.x + m.width and m.y <= win_center_y < m.y + m.height:
-                    logging.debug(f"ウィンドウ '{window.title}' はモニター {i+1} にあります。")
-                    return m
+            hwnd = window.hwnd
+            geometry = (window.left, window.top, window.width, window.height)
+            cached = self._window_monitor_cache.get(hwnd)
+            if cached is not None and cached[:4] == geometry:
+                return self.monitors[cached[4]], cached[4]
+
+            left, top, width, height = geometry
+            win_center_x = left + width / 2
+            win_center_y = top + height / 2
+            for i, (mon_left, mon_top, mon_right, mon_bottom) in enumerate(self._mon_bounds):
+                if mon_left <= win_center_x < mon_right and mon_top <= win_center_y < mon_bottom:
+                    logging.debug("ウィンドウ '%s' はモニター %s にあります。", window.title, i + 1)
+                    self._window_monitor_cache[hwnd] = geometry + (i,)
+                    return self.monitors[i], i
         except Exception as e:
             logging.warning(f"ウィンドウ '{window.title}' のモニター特定中にエラー: {e}。プライマリモニターを返します。")
 
-        logging.debug(f"ウィンドウ '{window.title}' がどのモニターにも見つからないため、プライマリモニターを返します。")
-        return self.monitors[0]
+        logging.debug("ウィンドウ '%s' がどのモニターにも見つからないため、プライマリモニターを返します。", window.title)
+        return self.monitors[0], 0
+
+    def forget_windows(self, hwnds):
+        """指定されたウィンドウハンドルのキャッシュを破棄する"""
+        for hwnd in hwnds:
+            self._window_monitor_cache.pop(hwnd, None)
+
+    def cached_window_handles(self):
+        """モニターキャッシュに保持しているウィンドウハンドルを返す"""
+        return list(self._window_monitor_cache)
 
 # --- ウィンドウ処理 ---
 class WindowManager:
@@ -440,25 +1160,88 @@ class WindowManager:
             logging.critical(f"モニター情報の取得に失敗しました。アプリケーションを続行できません: {e}")
             raise
         self.calculator = Calculator(monitors, self.settings.globals)
+        # WM_DISPLAYCHANGE を受け取ると立ち、次にルールを適用するときにモニター情報を取り直す
+        self._monitors_dirty = False
         # 処理済みウィンドウを、適用されたルール名と共に辞書で管理する
         self.processed_windows = {}
+        # どのルールにも一致しなかったウィンドウと、そのときのタイトル。
+        # クラス名とプロセスはウィンドウの生存中に変わらないため、同じタイトルのイベントでは評価をやり直さない
+        self._unmatched_titles = {}
+        # ウィンドウハンドルごとに (PID, プロセス名) をキャッシュする
+        self._hwnd_to_name = {}
+        # (PID, プロセス作成時刻) ごとにプロセス名をキャッシュし、同じプロセスの別ウィンドウで再利用する
+        self._pid_to_name = {}
+        # (取得時刻, 仮想デスクトップ数) のキャッシュ
+        self._vdesktop_count_cache = None
         self.is_paused = False
+        # processed_windows への単一の読み書きはGILの下でアトミックなため、ロックは一時停止の切り替えや
+        # 再読み込み、クリーンアップのような複数の状態をまとめて扱う操作にだけ使う
         self.lock = threading.Lock()
-
-        # クリーンアップタスクをスケジュールする
+        # 適用待ちの (ルール, スナップショット)。単一のワーカーが順番に取り出してウィンドウを操作する
+        self._apply_queue = asyncio.Queue()
+        # 処理待ちのウィンドウイベント (hwnd -> (TimerHandle, イベント))。短時間に続くイベントを1回の処理にまとめる
+        self._pending = {}
+        # フックスレッドからイベントごとに呼ぶバインド済みメソッドは、毎回作らずに使い回す
+        self._call_soon_threadsafe = self.loop.call_soon_threadsafe
+        self._schedule_window_event_bound = self._schedule_window_event
+
+        # クリーンアップタスクとルール適用ワーカーをスケジュールする
         asyncio.run_coroutine_threadsafe(self._cleanup_processed_windows_periodically(), self.loop)
+        asyncio.run_coroutine_threadsafe(self._apply_worker(), self.loop)
+
+    def post_window_event(self, hwnd, event):
+        """WinEventHookスレッドから呼ばれ、イベントをイベントループに渡して即座に戻る"""
+        # タイトル変更の再評価が無効なら、NAMECHANGE はイベントループに渡さずここで捨てる。
+        # ただし作成/表示イベントの処理待ちがあれば、タイトルが落ち着くまで待つよう渡す（in 判定はアトミック）
+        if (event == win32con.EVENT_OBJECT_NAMECHANGE and hwnd not in self._pending
+                and not self.settings.globals.get("recheck_on_title_change", False)):
+            return
+        self._call_soon_threadsafe(self._schedule_window_event_bound, hwnd, event, 0)
+
+    def post_window_destroyed(self, hwnd):
+        """WinEventHookスレッドから呼ばれ、追跡中のウィンドウが破棄されたときだけイベントループに通知する"""
+        # 破棄イベントは子ウィンドウなどでも大量に届くため、ここでは単一の in 判定（アトミック）だけで絞り込む
+        if (hwnd in self.processed_windows or hwnd in self._hwnd_to_name or hwnd in self._pending
+                or hwnd in self._unmatched_titles):
+            self.loop.call_soon_threadsafe(self._on_window_destroyed, hwnd)
+
+    def _on_window_destroyed(self, hwnd):
+        """破棄されたウィンドウの処理待ちを取り消し、各キャッシュから即座に削除する"""
+        pending = self._pending.pop(hwnd, None)
+        if pending is not None:
+            pending[0].cancel()
+        with self.lock:
+            self._forget_windows((hwnd,))
+        logging.debug("破棄されたウィンドウ (HWND: %s) の追跡を解除しました。", hwnd)
+
+    def _schedule_window_event(self, hwnd, event, attempt):
+        """ウィンドウの状態が落ち着くのを待ってから処理するよう、イベントループ上にタイマーを設定する。
+        同じウィンドウのイベントが続いた場合はタイマーを張り直し、1回の処理にまとめる"""
+        pending = self._pending.pop(hwnd, None)
+        if pending is not None:
+            pending_handle, pending_event = pending
+            pending_handle.cancel()
+            # 作成/表示イベントはタイトル変更イベントより優先し、まとめたことで取りこぼさないようにする
+            if event == win32con.EVENT_OBJECT_NAMECHANGE:
+                event = pending_event
+        # ブラウザなどはタイトルを短時間に何度も変えるため、タイトル変更は長めに待ってから1回だけ再評価する
+        delay = TITLE_CHANGE_SETTLE_DELAY if event == win32con.EVENT_OBJECT_NAMECHANGE else WINDOW_SETTLE_DELAY
+        handle = self.loop.call_later(delay, self._run_pending_window_event, hwnd, event, attempt)
+        self._pending[hwnd] = (handle, event)
+
+    def _run_pending_window_event(self, hwnd, event, attempt):
+        """タイマーの発火時に処理待ちから外し、ウィンドウイベントを処理する"""
+        self._pending.pop(hwnd, None)
+        self.handle_window_event(hwnd, event, attempt)
 
     def clear_log(self):
-        """ログファイルをクリアする"""
-        with self.lock:
-            try:
-                log_level_str = self.settings.globals.get("log_level", "INFO")
-                log_level = get_log_level_from_string(log_level_str)
-                setup_logging(level=log_level)
-                logging.info("ログファイルをクリアしました。")
-            except Exception as e:
-                print(f"ログファイルのクリア中にエラーが発生しました: {e}")
-                logging.error(f"ログファイルのクリア中にエラーが発生しました: {e}", exc_info=True)
+        """ログファイルをクリアする（ハンドラー側のロックで保護されるため、self.lock は取らない）"""
+        try:
+            clear_log_file()
+            logging.info("ログファイルをクリアしました。")
+        except Exception as e:
+            print(f"ログファイルのクリア中にエラーが発生しました: {e}")
+            logging.error(f"ログファイルのクリア中にエラーが発生しました: {e}", exc_info=True)
 
     def toggle_pause(self):
         """一時停止と再開を切り替える"""
@@ -473,7 +1256,7 @@ class WindowManager:
             if self.settings.globals.get("apply_on_resume", True):
                 self.processed_windows.clear()
                 logging.info("すべてのウィンドウにルールを再適用します。")
-                self.process_existing_windows()
+                self.loop.call_soon_threadsafe(self.process_existing_windows)
             else:
                 logging.info("新規ウィンドウのみルールを適用します（既存ウィンドウは対象外）。")
         return paused
@@ -485,17 +1268,20 @@ class WindowManager:
         apply_on_reload_flag = False
         try:
             with self.lock:
-                self.settings.load()
+                settings_changed = self.settings.load()
+                self._unmatched_titles.clear() # ルールが変わった可能性があるため、不一致の記録は破棄する
+                self._monitors_dirty = False # 明示的な再読み込みでは常にモニター情報を取り直す
                 monitors = get_monitors()
                 self.calculator = Calculator(monitors, self.settings.globals)
-                logging.info(f"{len(monitors)}個のモニター情報を更新しました。")
+                apply_on_reload_flag = self.settings.globals.get("apply_on_reload", True)
+            logging.info(f"{len(monitors)}個のモニター情報を更新しました。")
 
+            # ログレベルの変更はロックの外で行う
+            if settings_changed:
                 log_level_str = self.settings.globals.get("log_level", "INFO")
                 log_level = get_log_level_from_string(log_level_str)
                 setup_logging(level=log_level)
                 logging.info(f"ログレベルを「{log_level_str}」に設定しました。")
-                
-                apply_on_reload_flag = self.settings.globals.get("apply_on_reload", True)
 
         except Exception as e:
             logging.error(f"設定の再読み込み中に予期せぬエラーが発生しました: {e}", exc_info=True)
@@ -504,176 +1290,148 @@ class WindowManager:
         if apply_on_reload_flag:
             logging.info("すべてのウィンドウにルールを再適用します。")
             self.processed_windows.clear()
-            threading.Thread(target=self.process_existing_windows, daemon=True).start()
+            self.loop.call_soon_threadsafe(self.process_existing_windows)
         else:
             logging.info("新規ウィンドウのみルールを適用します（既存ウィンドウは対象外）。")
         
         logging.info("設定の再読み込みが完了しました。")
 
+    def _get_virtual_desktop_count(self, refresh=False):
+        """仮想デスクトップ数を返す。COM呼び出しを避けるため、短時間は前回の値を再利用する"""
+        now = time.monotonic()
+        cached = self._vdesktop_count_cache
+        if not refresh and cached is not None and now - cached[0] < VIRTUAL_DESKTOP_COUNT_TTL:
+            return cached[1]
+        from pyvda import get_virtual_desktops # COMの初期化を伴うため、初めて必要になるまで読み込まない
+        count = len(get_virtual_desktops())
+        self._vdesktop_count_cache = (now, count)
+        return count
+
+    def mark_monitors_dirty(self):
+        """WinEventHookスレッドから呼ばれ、モニター構成の変更を記録する（再取得は次の適用時まで遅らせる）"""
+        self._monitors_dirty = True
+        logging.info("ディスプレイ構成の変更を検出しました。次回のルール適用時にモニター情報を更新します。")
+
+    def _get_calculator(self):
+        """モニター構成が変わっていれば、モニター情報を取り直して Calculator を作り直してから返す"""
+        if self._monitors_dirty:
+            self._monitors_dirty = False
+            monitors = get_monitors()
+            self.calculator = Calculator(monitors, self.settings.globals)
+            logging.info(f"{len(monitors)}個のモニター情報を更新しました。")
+        return self.calculator
+
+    def _get_process_name_pair(self, hwnd):
+        """プロセス名と、その小文字化した値の組を返す（取得できない場合は (None, None)）"""
+        name = self._get_process_name(hwnd)
+        return (name, name.lower()) if name else (None, None)
+
     def _get_process_name(self, hwnd):
-        """ウィンドウハンドルからプロセス名を取得する"""
+        """ウィンドウハンドルからプロセス名を取得する（ウィンドウの生存期間中はキャッシュする）"""
+        pid = 0
         try:
-            pid = ctypes.c_ulong()
-            ctypes.windll.user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
-            if pid.value == 0:
+            pid = get_window_pid(hwnd)
+            if pid == 0:
                 return None
-            return psutil.Process(pid.value).name()
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            return None
+            # 破棄イベントを取りこぼしてハンドルが再利用された場合に備え、PIDが一致するときだけキャッシュを使う
+            cached = self._hwnd_to_name.get(hwnd)
+            if cached is not None and cached[0] == pid:
+                return cached[1]
+            start_time = query_process_start_time(pid)
+            pid_key = (pid, start_time)
+            if start_time is not None and pid_key in self._pid_to_name:
+                name = self._pid_to_name[pid_key]
+            else:
+                # 取得できない（アクセス拒否など）場合もウィンドウの所有プロセスは変わらないため、Noneのままキャッシュする
+                name = query_process_image_name(pid)
+                if start_time is not None:
+                    self._pid_to_name[pid_key] = name
+                    if len(self._pid_to_name) > PROCESS_NAME_CACHE_SIZE:
+                        # 挿入順に保持されるため、最も古いエントリから捨てる (FIFO)
+                        del self._pid_to_name[next(iter(self._pid_to_name))]
+            self._hwnd_to_name[hwnd] = (pid, name)
+            return name
         except Exception as e:
-            logging.error(f"プロセス名取得中に予期せぬエラー (PID: {pid.value}): {e}", exc_info=True)
+            logging.error(f"プロセス名取得中に予期せぬエラー (PID: {pid}): {e}", exc_info=True)
             return None
 
-    def _check_single_condition(self, window, process_name, class_name, condition):
-        """
-        単一の条件ブロックをチェックする。
-        ブロック内に複数の条件（title, processなど）がある場合、それらはANDとして評価される。
-        何も条件が指定されていない場合は、Falseを返す。
-        """
-        title_pattern = condition.get("title")
-        process_pattern = condition.get("process")
-        class_pattern = condition.get("class_name")
-        case_sensitive = condition.get("case_sensitive", False)
-
-        if not title_pattern and not process_pattern and not class_pattern:
-            return False
-
-        if title_pattern:
-            title_matched = False
-            try:
-                if title_pattern.startswith("regex:"):
-                    pattern = title_pattern.replace("regex:", "", 1)
-                    if re.search(pattern, window.title, 0 if case_sensitive else re.IGNORECASE):
-                        title_matched = True
-                elif case_sensitive:
-                    if title_pattern in window.title:
-                        title_matched = True
-                else:
-                    if title_pattern.lower() in window.title.lower():
-                        title_matched = True
-            except re.error as e:
-                logging.warning(f'タイトル条件の正規表現 "{title_pattern}" が不正です: {e}')
-            
-            if not title_matched:
-                return False
-
-        if process_pattern:
-            process_matched = False
-            if process_name:
-                try:
-                    if process_pattern.startswith("regex:"):
-                        pattern = process_pattern.replace("regex:", "", 1)
-                        if re.fullmatch(pattern, process_name, 0 if case_sensitive else re.IGNORECASE):
-                            process_matched = True
-                    elif case_sensitive:
-                        if process_pattern == process_name:
-                            process_matched = True
-                    else:
-                        if process_pattern.lower() == process_name.lower():
-                            process_matched = True
-                except re.error as e:
-                    logging.warning(f'プロセス条件の正規表現 "{process_pattern}" が不正です: {e}')
-
-            if not process_matched:
-                return False
+    def handle_window_event(self, hwnd, event, attempt=0):
+        """イベントループ上で実行され、イベントタイプに応じてウィンドウを処理する"""
+        # 再読み込みで途中から別の設定に切り替わらないよう、前処理済みの設定はイベントごとに一度だけ取得する
+        compiled = self.settings.compiled
+        is_title_change_event = (event == win32con.EVENT_OBJECT_NAMECHANGE)
+        if is_title_change_event and not compiled.globals.get("recheck_on_title_change", False):
+            return
 
-        if class_pattern:
-            class_matched = False
-            if class_name:
-                try:
-                    if class_pattern.startswith("regex:"):
-                        pattern = class_pattern.replace("regex:", "", 1)
-                        if re.search(pattern, class_name, 0 if case_sensitive else re.IGNORECASE):
-                            class_matched = True
-                    elif case_sensitive:
-                        if class_pattern in class_name:
-                            class_matched = True
-                    else:
-                        if class_pattern.lower() in class_name.lower():
-                            class_matched = True
-                except re.error as e:
-                    logging.warning(f'クラス条件の正規表現 "{class_pattern}" が不正です: {e}')
-            
-            if not class_matched:
-                return False
+        if self.is_paused:
+            return
+        previously_applied_rule = self.processed_windows.get(hwnd)
 
-        return True
+        if not is_title_change_event and previously_applied_rule is not None:
+            return
 
-    def _check_rule_conditions(self, window, process_name, class_name, rule_condition):
-        """ルールの条件全体（AND/OR）をチェックする"""
-        conditions = rule_condition.get("conditions")
-        if not conditions:
-            return self._check_single_condition(window, process_name, class_name, rule_condition)
-        
-        logic = rule_condition.get("logic", "AND").upper()
         try:
-            if logic == "OR":
-                return any(self._check_single_condition(window, process_name, class_name, c) for c in conditions)
-            else:
-                return all(self._check_single_condition(window, process_name, class_name, c) for c in conditions)
-        except Exception as e:
-            logging.error(f"ルール条件の評価中にエラーが発生しました: {e}", exc_info=True)
-            return False
-
-    def handle_window_event(self, hwnd, event):
-        """WinEventHookからのコールバック。イベントタイプに応じてウィンドウを処理する"""
-        with self.lock:
-            if self.is_paused:
+            if not win32gui.IsWindow(hwnd):
                 return
 
-            is_title_change_event = (event == win32con.EVENT_OBJECT_NAMECHANGE)
-            
-            if is_title_change_event and not self.settings.globals.get("recheck_on_title_change", False):
-                return
+            # プロセス名の取得はコストが高いため、プロセス条件の評価で必要になった時だけ一度取得する
+            get_process = functools.lru_cache(maxsize=1)(lambda: self._get_process_name_pair(hwnd))
 
-            previously_applied_rule = self.processed_windows.get(hwnd)
-
-            if not is_title_change_event and previously_applied_rule is not None:
+            snapshot = None
+            if _IsWindowVisible(hwnd) and not _IsIconic(hwnd):
+                snapshot = take_window_snapshot(hwnd)
+            if snapshot is None or not snapshot.title:
+                # まだ表示・タイトル設定が済んでいない場合は、スレッドを止めずに少し後で再試行する
+                if attempt + 1 < WINDOW_SETTLE_ATTEMPTS:
+                    self._schedule_window_event(hwnd, event, attempt + 1)
                 return
-
-        window = None
-        for attempt in range(3):
-            time.sleep(0.02)
-            try:
-                temp_window = gw.Win32Window(hwnd)
-                if temp_window.visible and not temp_window.isMinimized and temp_window.title:
-                    window = temp_window
-                    break
-            except gw.PyGetWindowException:
+            title = snapshot.title
+            if self._unmatched_titles.get(hwnd) == title:
+                # 前回どのルールにも一致しなかったときとタイトルが同じであれば、結果も変わらない
                 return
-            except Exception:
-                pass
 
-        if not window:
-            return
-            
-        try:
-            if not (window.visible and not window.isMinimized and window.title):
-                return
+            # プロセス名の取得はコストが高いため、表示状態などの軽い確認を通ったウィンドウだけを対象にする。
+            # プロセス名だけで無視できるウィンドウは、クラス名の取得やルールの評価より前に除外する
+            for ignore_rule in compiled.process_ignores:
+                if ignore_rule["_process_match_fn"](None, None, get_process, None, None):
+                    ignore_name = ignore_rule.get("name", "無名無視ルール")
+                    logging.info(f"無視ルール '{ignore_name}' に一致したため、プロセス '{get_process()[0]}' のウィンドウの処理をスキップします。")
+                    self.processed_windows[hwnd] = "ignored" # 無視したことも記録
+                    return
 
-            try:
-                class_name = win32gui.GetClassName(hwnd)
-            except win32gui.error:
-                class_name = None
+            # クラス名はクラス条件を使う設定のときだけ取得する（DEBUGログでは確認用に常に取得する）
+            debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+            if compiled.needs_class_name or debug_enabled:
+                class_name = get_class_name(hwnd)
+                class_lower = class_name.lower() if class_name else None
+            else:
+                class_name = class_lower = None
 
-            process_name = self._get_process_name(hwnd)
+            # タイトルはイベントごとに一度だけ取得・小文字化し、全ルールで共有する
+            title_lower = title.lower()
             
-            event_name = "作成/表示" if not is_title_change_event else "タイトル変更"
-            logging.debug(f"イベント受信 ({event_name}): タイトル='{window.title}', プロセス='{process_name}', クラス='{class_name}'")
+            if debug_enabled:
+                event_name = "作成/表示" if not is_title_change_event else "タイトル変更"
+                logging.debug(f"イベント受信 ({event_name}): タイトル='{title}', プロセス='{get_process()[0]}', クラス='{class_name}'")
 
             # 無視ルールは常に最優先
-            for ignore_rule in self.settings.ignores:
-                if self._check_rule_conditions(window, process_name, class_name, ignore_rule):
+            for ignore_rule in compiled.ignores:
+                if ignore_rule["_match_fn"](title, title_lower, get_process, class_name, class_lower):
                     ignore_name = ignore_rule.get("name", "無名無視ルール")
-                    logging.info(f"無視ルール '{ignore_name}' に一致したため、ウィンドウ '{window.title}' の処理をスキップします。")
-                    with self.lock:
-                        self.processed_windows[hwnd] = "ignored" # 無視したことも記録
+                    logging.info(f"無視ルール '{ignore_name}' に一致したため、ウィンドウ '{title}' の処理をスキップします。")
+                    self.processed_windows[hwnd] = "ignored" # 無視したことも記録
                     return
 
             # ルール評価
             matched_rule = None
-            for rule in self.settings.rules:
-                if self._check_rule_conditions(window, process_name, class_name, rule.get("condition", {})):
+            # プロセス名で索引されたルールがあれば、このウィンドウのプロセスで一致し得るルールだけを評価する
+            rules_by_process = compiled.rules_by_process
+            if rules_by_process:
+                candidate_rules = rules_by_process.get(get_process()[1], compiled.residual_rules)
+            else:
+                candidate_rules = compiled.rules
+            for rule in candidate_rules:
+                if rule["_match_fn"](title, title_lower, get_process, class_name, class_lower):
                     matched_rule = rule
                     break
             
@@ -681,143 +1439,180 @@ class WindowManager:
                 rule_name = matched_rule.get("name", "無名ルール")
                 # タイトル変更イベントで、かつ前回適用されたルールと同じ場合はアクションをスキップ
                 if is_title_change_event and previously_applied_rule == rule_name:
-                    logging.debug(f"タイトルは変更されましたが、前回と同じルール '{rule_name}' にマッチしたため、アクションは再実行しません。")
+                    logging.debug("タイトルは変更されましたが、前回と同じルール '%s' にマッチしたため、アクションは再実行しません。", rule_name)
                     return
 
                 # 新規適用、または別のルールへの変更
                 log_prefix = "新規ルール適用:" if not previously_applied_rule else f"ルール変更 ({previously_applied_rule} -> {rule_name}):"
-                logging.info(f"{log_prefix} '{window.title}' にルール '{rule_name}' を適用します。")
+                logging.info(f"{log_prefix} '{title}' にルール '{rule_name}' を適用します。")
                 
-                with self.lock:
-                    self.processed_windows[hwnd] = rule_name
-                
-                asyncio.run_coroutine_threadsafe(self._apply_rule_async(matched_rule, window), self.loop)
+                self.processed_windows[hwnd] = rule_name
+                self._unmatched_titles.pop(hwnd, None)
+                self._enqueue_apply(matched_rule, snapshot)
 
-            elif previously_applied_rule:
-                # どのルールにもマッチしなくなった場合
-                logging.info(f"ウィンドウ '{window.title}' はどのルールにもマッチしなくなったため、追跡を解除します。(旧ルール: {previously_applied_rule})")
-                self._discard_window(hwnd)
+            else:
+                self._unmatched_titles[hwnd] = title
+                if previously_applied_rule:
+                    # どのルールにもマッチしなくなった場合
+                    logging.info(f"ウィンドウ '{title}' はどのルールにもマッチしなくなったため、追跡を解除します。(旧ルール: {previously_applied_rule})")
+                    self._discard_window(hwnd)
 
-        except gw.PyGetWindowException:
-            pass
         except Exception as e:
             logging.error(f"ウィンドウイベント処理中にエラーが発生しました (HWND: {hwnd}): {e}", exc_info=True)
 
     def process_existing_windows(self):
-        """起動時に既存のウィンドウをすべて処理する"""
+        """既存のウィンドウをすべて処理対象としてイベントキューに積む"""
         if not self.settings.globals.get("apply_on_startup", True):
             logging.info("起動時のルール適用はスキップします。")
             return
         
         logging.info("既存のウィンドウにルールを適用します...")
         try:
-            for window in gw.getAllWindows():
-                if window.visible and not window.isMinimized and window.title:
-                    # 既存ウィンドウは新規作成イベントとして扱う
-                    self.handle_window_event(window._hWnd, win32con.EVENT_OBJECT_CREATE)
+            class_matchers = [ignore["_class_match_fn"] for ignore in self.settings.class_ignores]
+            for hwnd in enum_candidate_hwnds(self.processed_windows, class_matchers):
+                # 既存ウィンドウは新規作成イベントとして扱い、フックからのイベントと同じキューで順に処理する
+                self.post_window_event(hwnd, win32con.EVENT_OBJECT_CREATE)
         except Exception as e:
             logging.error(f"既存ウィンドウの処理中にエラー: {e}", exc_info=True)
 
-    async def _apply_rule_async(self, rule, window):
-        """非同期で単一のルールをウィンドウに適用する"""
+    def _enqueue_apply(self, rule, snapshot):
+        """ルールの適用を適用キューに積む。execution_delay がある場合は、遅延後に積むようタイマーを設定する"""
+        # ワーカーを遅延で占有しないよう、待機はキューに積む前にタイマーで行う
+        delay_ms = rule.get("action", {}).get("execution_delay")
+        if isinstance(delay_ms, int) and delay_ms > 0:
+            logging.info(f" -> アクション実行を {delay_ms}ms 遅延します。")
+            self.loop.call_later(delay_ms / 1000, self._on_apply_delay_elapsed, rule, snapshot, delay_ms)
+        else:
+            self._apply_queue.put_nowait((rule, snapshot))
+
+    def _on_apply_delay_elapsed(self, rule, snapshot, delay_ms):
+        """execution_delay の経過後に呼ばれ、ルールの適用を適用キューに積む"""
+        logging.info(f" -> {delay_ms}ms の遅延が完了しました。")
+        self._apply_queue.put_nowait((rule, snapshot))
+
+    async def _apply_worker(self):
+        """適用キューからルールを順番に取り出し、ウィンドウに適用する"""
+        while True:
+            rule, snapshot = await self._apply_queue.get()
+            current_rule_name = self.processed_windows.get(snapshot.hwnd)
+            # 積んだ後に追跡が解除された、または別のルールに置き換わった古い要求は捨てる
+            if current_rule_name != rule.get("name", "無名ルール"):
+                continue
+            # 1件の失敗でワーカーが止まり、以降のルールが適用されなくなることのないようにする
+            try:
+                self._apply_rule(rule, snapshot)
+            except Exception as e:
+                logging.error(f"ルールの適用処理中に予期せぬエラーが発生しました: {e}", exc_info=True)
+                self._discard_window(snapshot.hwnd) # 次のイベントで再度処理できるよう、処理済みの記録を外す
+
+    def _apply_rule(self, rule, snapshot):
+        """単一のルールをウィンドウに適用する"""
         rule_name = rule.get("name", "無名ルール")
         action = rule.get("action", {})
+        hwnd = snapshot.hwnd
         
         try:
-            # execution_delay はアクションの実行を遅延させる
-            delay_ms = action.get("execution_delay")
-            if isinstance(delay_ms, int) and delay_ms > 0:
-                logging.info(f" -> アクション実行を {delay_ms}ms 遅延します。")
-                await asyncio.sleep(delay_ms / 1000)
-                logging.info(f" -> {delay_ms}ms の遅延が完了しました。")
-
-            # --- 提案: ここでウィンドウの状態を再チェック ---
-            try:
-                # windowオブジェクトを再取得して最新の状態を反映
-                current_window = gw.Win32Window(window._hWnd)
-                if not current_window.visible or current_window.isMinimized:
-                    logging.warning(f'アクション実行前にウィンドウ "{current_window.title}" が非表示/最小化されたため中断します。')
-                    self._discard_window(window._hWnd)
-                    return
-                # 以降の処理では current_window を使う
-                window = current_window 
-            except gw.PyGetWindowException:
-                logging.warning(f'アクション実行前にウィンドウハンドルが無効になったため中断します。')
-                self._discard_window(window._hWnd)
+            # 遅延の間に状態が変わっている可能性があるため、実行直前にウィンドウを再確認する
+            # （無効なハンドルに対して IsWindowVisible は偽を返すため、IsWindow の確認は兼ねている）
+            if not _IsWindowVisible(hwnd) or _IsIconic(hwnd):
+                logging.warning(f'アクション実行前にウィンドウ "{snapshot.title}" が閉じられたか、非表示/最小化されたため中断します。')
+                self._discard_window(hwnd)
                 return
-            # --- ここまで ---
-
-            if not win32gui.IsWindow(window._hWnd) or not window.visible or window.isMinimized:
-                logging.warning(f'アクション実行前にウィンドウ "{window.title}" が無効になったため、処理を中断します。')
-                self._discard_window(window._hWnd)
+            current = take_window_snapshot(hwnd)
+            if current is None:
+                logging.warning(f'アクション実行前にウィンドウ "{snapshot.title}" が無効になったため、処理を中断します。')
+                self._discard_window(hwnd)
                 return
+            snapshot = current
 
-            with self.lock:
-                if not win32gui.IsWindow(window._hWnd) or not window.visible or window.isMinimized:
-                    self._discard_window(window._hWnd)
-                    return
+            # Win32/COM呼び出しはロックを保持せずに行う（ロックは processed_windows の保護のみに使う）
+            target_workspace = action.get("target_workspace")
+            if isinstance(target_workspace, int):
+                try:
+                    num_desktops = self._get_virtual_desktop_count()
+                    if target_workspace > num_desktops:
+                        # キャッシュ後にデスクトップが追加された可能性があるため、一度だけ再取得する
+                        num_desktops = self._get_virtual_desktop_count(refresh=True)
+                    if 1 <= target_workspace <= num_desktops:
+                        logging.info(f" -> 仮想デスクトップ {target_workspace} に移動します。")
+                        from pyvda import AppView, VirtualDesktop
+                        AppView(hwnd=hwnd).move(VirtualDesktop(number=target_workspace))
+                    else:
+                        logging.warning(f"指定された仮想デスクトップ {target_workspace} は存在しません (利用可能なデスクトップ数: {num_desktops})。")
+                except Exception as e:
+                    logging.error(f"仮想デスクトップの移動中にエラーが発生しました: {e}", exc_info=True)
 
-                target_workspace = action.get("target_workspace")
-                if isinstance(target_workspace, int):
-                    try:
-                        num_desktops = len(get_virtual_desktops())
-                        if 1 <= target_workspace <= num_desktops:
-                            logging.info(f" -> 仮想デスクトップ {target_workspace} に移動します。")
-                            AppView(hwnd=window._hWnd).move(VirtualDesktop(number=target_workspace))
-                        else:
-                            logging.warning(f"指定された仮想デスクトップ {target_workspace} は存在しません (利用可能なデスクトップ数: {num_desktops})。")
-                    except Exception as e:
-                        logging.error(f"仮想デスクトップの移動中にエラーが発生しました: {e}", exc_info=True)
-
-                if action.get("maximize", "").upper() == "ON":
-                    window.maximize()
+            if action.get("maximize", "").upper() == "ON":
+                if _IsZoomed(hwnd):
+                    logging.debug(" -> ウィンドウは既に最大化されているため、操作をスキップします。")
+                else:
+                    win32gui.ShowWindow(hwnd, win32con.SW_MAXIMIZE)
                     logging.info(" -> ウィンドウを最大化しました。")
-                elif action.get("minimize", "").upper() == "ON":
-                    window.minimize()
-                    logging.info(" -> ウィンドウを最小化しました。")
-                elif action.get("move_to") or action.get("resize_to"):
-                    x, y, w, h = self.calculator.get_target_rect(action, window)
-                    
-                    current_left, current_top, current_width, current_height = window.left, window.top, window.width, window.height
-                    
-                    if w != current_width or h != current_height:
-                        logging.info(f" -> サイズを {w}x{h} に変更します。")
-                        window.resizeTo(w, h)
-                    if x != current_left or y != current_top:
-                        logging.info(f" -> 位置を ({x}, {y}) に移動します。")
-                        window.moveTo(x, y)
-
-        except gw.PyGetWindowException as e:
-            logging.warning(f'ウィンドウ "{window.title}" の操作に失敗しました: {e}')
-            self._discard_window(window._hWnd)
+            elif action.get("minimize", "").upper() == "ON":
+                win32gui.ShowWindow(hwnd, win32con.SW_MINIMIZE)
+                logging.info(" -> ウィンドウを最小化しました。")
+            elif action.get("move_to") or action.get("resize_to"):
+                x, y, w, h = self._get_calculator().get_target_rect(action, snapshot)
+                
+                resize = w != snapshot.width or h != snapshot.height
+                move = x != snapshot.left or y != snapshot.top
+                if resize:
+                    logging.info(f" -> サイズを {w}x{h} に変更します。")
+                if move:
+                    logging.info(f" -> 位置を ({x}, {y}) に移動します。")
+                # 位置とサイズは1回の SetWindowPos で変更し、リサイズと移動が別々に描画されるのを防ぐ
+                if (resize or move) and not set_window_rect(hwnd, x, y, w, h, move=move, resize=resize):
+                    logging.warning(f'ウィンドウ "{snapshot.title}" の移動/リサイズに失敗しました (エラーコード: {ctypes.get_last_error()})')
+                    self._discard_window(hwnd)
+
         except Exception as e:
             logging.error(f'ルール "{rule_name}" の適用中に予期せぬエラーが発生しました: {e}', exc_info=True)
-            self._discard_window(window._hWnd)
+            self._discard_window(hwnd)
 
     def _discard_window(self, hwnd):
-        """処理済み辞書からウィンドウを安全に削除する"""
-        with self.lock:
-            self.processed_windows.pop(hwnd, None)
+        """処理済み辞書からウィンドウを削除する（単一の pop はアトミックなためロックは不要）"""
+        self.processed_windows.pop(hwnd, None)
 
     async def _cleanup_processed_windows_periodically(self):
-        """processed_windows 辞書を定期的にクリーンアップする"""
+        """
+        processed_windows 辞書と各キャッシュを定期的にクリーンアップする。
+        閉じられたウィンドウは通常 EVENT_OBJECT_DESTROY で即座に削除されるため、これは取りこぼしに備えた安全策として動く。
+        """
         cleanup_interval = self.settings.globals.get("cleanup_interval_seconds", 300)
         logging.info(f"{cleanup_interval}秒ごとに無効なウィンドウハンドルのクリーンアップを実行します。")
         
         while True:
             await asyncio.sleep(cleanup_interval)
             with self.lock:
-                if not self.processed_windows:
-                    continue
+                # 各キャッシュが保持するハンドルをまとめる（ロック中は辞書の複製だけを行う）
+                tracked_hwnds = set(self.processed_windows)
+                tracked_hwnds.update(self._hwnd_to_name)
+                tracked_hwnds.update(self._unmatched_titles)
+                tracked_hwnds.update(self.calculator.cached_window_handles())
+            if not tracked_hwnds:
+                continue
 
-                logging.debug(f"クリーンアップ開始: 現在 {len(self.processed_windows)}個のウィンドウを追跡中。")
-                
-                invalid_hwnds = {hwnd for hwnd in self.processed_windows if not win32gui.IsWindow(hwnd)}
-                
-                if invalid_hwnds:
-                    for hwnd in invalid_hwnds:
-                        self.processed_windows.pop(hwnd, None)
-                    logging.info(f"{len(invalid_hwnds)}個の無効なウィンドウハンドルをクリーンアップしました。")
+            logging.debug("クリーンアップ開始: 現在 %d個のウィンドウを追跡中。", len(tracked_hwnds))
+
+            # ハンドルごとに IsWindow を呼ぶ代わりに、存在するウィンドウを一度に列挙して差分を取る
+            invalid_hwnds = tracked_hwnds - enum_top_level_hwnds()
+
+            if invalid_hwnds:
+                with self.lock:
+                    self._forget_windows(invalid_hwnds)
+                logging.info(f"{len(invalid_hwnds)}個の無効なウィンドウハンドルをクリーンアップしました。")
+
+    def _forget_windows(self, hwnds):
+        """閉じられたウィンドウの情報を、処理済み辞書と各キャッシュからまとめて削除する（ロック取得済みで呼ぶこと）"""
+        for hwnd in hwnds:
+            self.processed_windows.pop(hwnd, None)
+            self._unmatched_titles.pop(hwnd, None)
+            self._hwnd_to_name.pop(hwnd, None)
+        self.calculator.forget_windows(hwnds)
+        # どのウィンドウからも参照されなくなったプロセスの名前キャッシュも破棄する
+        live_pids = {pid for pid, _ in self._hwnd_to_name.values()}
+        for pid_key in [key for key in self._pid_to_name if key[0] not in live_pids]:
+            del self._pid_to_name[pid_key]
 
 # --- Win32 イベントフック (ctypes) ---
 WINEVENTPROC = ctypes.WINFUNCTYPE(
@@ -825,9 +1620,12 @@ WINEVENTPROC = ctypes.WINFUNCTYPE(
     wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
 
 class WinEventHook(threading.Thread):
-    def __init__(self, callback):
+    def __init__(self, callback, destroy_callback, display_change_callback=None):
         super().__init__(name="WinEventHookThread", daemon=True)
         self.callback = callback
+        self.destroy_callback = destroy_callback
+        self.display_change_callback = display_change_callback
+        self.display_change_hwnd = None
         self.hooks = []
         self.running = False
         self.user32 = ctypes.windll.user32
@@ -838,19 +1636,25 @@ class WinEventHook(threading.Thread):
         self.running = True
         try:
             # 複数のイベントフックをセットアップ
-            self.hooks.append(self.user32.SetWinEventHook(
-                win32con.EVENT_OBJECT_CREATE, win32con.EVENT_OBJECT_SHOW,
-                0, self.event_proc_obj, 0, 0, win32con.WINEVENT_OUTOFCONTEXT | win32con.WINEVENT_SKIPOWNPROCESS))
-            
-            self.hooks.append(self.user32.SetWinEventHook(
-                win32con.EVENT_OBJECT_NAMECHANGE, win32con.EVENT_OBJECT_NAMECHANGE,
-                0, self.event_proc_obj, 0, 0, win32con.WINEVENT_OUTOFCONTEXT | win32con.WINEVENT_SKIPOWNPROCESS))
+            # 必要なイベントだけを登録し、それ以外はOS側で除外させる（自プロセスのイベントも WINEVENT_SKIPOWNPROCESS で除外）
+            flags = win32con.WINEVENT_OUTOFCONTEXT | win32con.WINEVENT_SKIPOWNPROCESS
+            # CREATE, DESTROY, SHOW は連続した値のため、1つのフックで受け取る
+            event_ranges = [(win32con.EVENT_OBJECT_CREATE, win32con.EVENT_OBJECT_SHOW),
+                            (win32con.EVENT_OBJECT_NAMECHANGE, win32con.EVENT_OBJECT_NAMECHANGE)]
+            for event_min, event_max in event_ranges:
+                self.hooks.append(self.user32.SetWinEventHook(
+                    event_min, event_max, 0, self.event_proc_obj, 0, 0, flags))
 
             if not all(self.hooks):
                 logging.error("Win32 イベントフックの開始に失敗しました。")
                 return
 
-            logging.info("Win32 イベントフックを開始しました。(CREATE, SHOW, NAMECHANGE)")
+            # 実際に登録した範囲から、受け取るイベントの一覧を作る
+            event_names = [WIN_EVENT_NAMES.get(event, hex(event))
+                           for event_min, event_max in event_ranges for event in range(event_min, event_max + 1)]
+            logging.info(f"Win32 イベントフックを開始しました。({', '.join(event_names)})")
+            if self.display_change_callback is not None:
+                self._create_display_change_window()
             msg = wintypes.MSG()
             while self.user32.GetMessageW(ctypes.byref(msg), None, 0, 0) != 0:
                 self.user32.TranslateMessage(ctypes.byref(msg))
@@ -859,8 +1663,35 @@ class WinEventHook(threading.Thread):
         except Exception as e:
             logging.critical(f"WinEventフックスレッドで致命的なエラー: {e}", exc_info=True)
         finally:
+            if self.display_change_hwnd:
+                win32gui.DestroyWindow(self.display_change_hwnd)
+                self.display_change_hwnd = None
             logging.info("WinEventフックスレッドが終了しました。")
 
+    def _create_display_change_window(self):
+        """
+        WM_DISPLAYCHANGE を受け取るための非表示ウィンドウをこのスレッドに作成する。
+        ブロードキャストはメッセージ専用ウィンドウには届かないため、通常のトップレベルウィンドウを非表示で使う。
+        """
+        try:
+            wc = win32gui.WNDCLASS()
+            wc.lpfnWndProc = {win32con.WM_DISPLAYCHANGE: self._on_display_change}
+            wc.lpszClassName = DISPLAY_CHANGE_WINDOW_CLASS
+            wc.hInstance = win32api.GetModuleHandle(None)
+            class_atom = win32gui.RegisterClass(wc)
+            self.display_change_hwnd = win32gui.CreateWindow(
+                class_atom, DISPLAY_CHANGE_WINDOW_CLASS, 0, 0, 0, 0, 0, 0, 0, wc.hInstance, None)
+        except win32gui.error as e:
+            logging.warning(f"ディスプレイ変更通知用ウィンドウの作成に失敗しました。モニター構成の変更は設定の再読み込みで反映してください: {e}")
+
+    def _on_display_change(self, hwnd, msg, wparam, lparam):
+        """WM_DISPLAYCHANGE を受け取り、コールバックに通知する"""
+        try:
+            self.display_change_callback()
+        except Exception as e:
+            logging.error(f"ディスプレイ変更の通知中にエラーが発生しました: {e}", exc_info=True)
+        return 0
+
     def stop(self):
         """イベントフックを解除し、メッセージループを終了する"""
         for h in self.hooks:
@@ -877,6 +1708,14 @@ class WinEventHook(threading.Thread):
         """イベントコールバック関数"""
         if idObject != win32con.OBJID_WINDOW or idChild != 0:
             return
+        if event == win32con.EVENT_OBJECT_DESTROY:
+            # 破棄済みのハンドルには IsWindow / GetParent が使えないため、判定はコールバック側に任せる
+            if hwnd:
+                try:
+                    self.destroy_callback(hwnd)
+                except Exception as e:
+                    logging.error(f"破棄イベント処理コールバックでエラー (HWND: {hwnd}): {e}", exc_info=True)
+            return
         if not hwnd or not win32gui.IsWindow(hwnd) or win32gui.GetParent(hwnd) != 0:
             return
         try:
@@ -891,6 +1730,10 @@ class Tray:
         self.window_manager = window_manager
         self.win_event_hook = win_event_hook
 
+        # トレイ関連のモジュールは読み込みが重いため、イベントフックの開始後に読み込む
+        import pystray
+        from PIL import Image
+
         try:
             self.icon_running = Image.open(os.path.join(application_path, "window_mover.ico"))
             self.icon_paused = Image.open(os.path.join(application_path, "window_mover_pause.ico"))
@@ -934,6 +1777,8 @@ class Tray:
     def _open_log_action(self, icon, item):
         """ログファイルをnotepad.exeで開く"""
         try:
+            # バッファに溜まっているログを書き出してから開く
+            flush_log_file()
             # LOG_FILEはmain()で絶対パスに更新されているグローバル変数
             if os.path.exists(LOG_FILE):
                 subprocess.Popen(["notepad.exe", LOG_FILE])
@@ -958,6 +1803,7 @@ class Tray:
 
     def _create_default_image(self, width, height, color1, color2):
         """デフォルトのアイコン画像を生成する"""
+        from PIL import Image, ImageDraw
         image = Image.new("RGB", (width, height), color1)
         dc = ImageDraw.Draw(image)
         dc.rectangle((width // 2, 0, width, height // 2), fill=color2)
@@ -979,7 +1825,11 @@ class Tray:
 class AsyncWorker(threading.Thread):
     def __init__(self):
         super().__init__(name="AsyncWorkerThread", daemon=True)
-        self.loop = asyncio.new_event_loop()
+        try:
+            import winloop # インストールされていれば、コールバックのスケジューリングが軽いイベントループを使う
+            self.loop = winloop.new_event_loop()
+        except ImportError:
+            self.loop = asyncio.new_event_loop()
 
     def run(self):
         asyncio.set_event_loop(self.loop)
@@ -1033,15 +1883,13 @@ def main():
         window_manager = WindowManager(settings, async_worker.loop)
         
         # Win32イベントフックを開始
-        win_event_hook = WinEventHook(window_manager.handle_window_event)
+        win_event_hook = WinEventHook(
+            window_manager.post_window_event, window_manager.post_window_destroyed, window_manager.mark_monitors_dirty)
         win_event_hook.start()
         
-        # 起動時のウィンドウ処理
-        def startup_task():
-            time.sleep(1) # イベントフックとの競合を避けるための待機
-            window_manager.process_existing_windows()
-        
-        threading.Thread(target=startup_task, daemon=True).start()
+        # 起動時のウィンドウ処理（イベントフックとの競合を避けるため、1秒待ってからイベントループ上で行う）
+        async_worker.loop.call_soon_threadsafe(
+            async_worker.loop.call_later, STARTUP_SWEEP_DELAY, window_manager.process_existing_windows)
 
         tray = Tray(window_manager, win_event_hook, application_path)
         tray.run() # これはブロッキング呼び出し
@@ -1061,6 +1909,7 @@ def main():
             if async_worker.is_alive():
                 logging.warning("AsyncWorkerThread が時間内に終了しませんでした。")
         logging.info("アプリケーションが終了しました。")
+        shutdown_logging()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
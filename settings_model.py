@@ -1,11 +1,11 @@
 import re
-from pydantic import BaseModel, Field, field_validator, AliasChoices
-from typing import List, Dict, Any, Literal, Union
+from pydantic import BaseModel, ConfigDict, Field, field_validator, AliasChoices, Discriminator, Tag
+from typing import List, Dict, Any, Literal, Union, Annotated
 
 # --- 基底モデル ---
 class BaseSettingsModel(BaseModel):
-    class Config:
-        extra = 'forbid'  # 未知のフィールドを禁止
+    # 未知のフィールドを禁止し、読み込み後は変更されないため凍結する
+    model_config = ConfigDict(extra='forbid', frozen=True)
 
 # --- Condition ---
 class Condition(BaseSettingsModel):
@@ -18,6 +18,17 @@ class ConditionGroup(BaseSettingsModel):
     logic: Literal['AND', 'OR'] = 'AND'
     conditions: List[Condition]
 
+def _condition_kind(v: Any) -> str:
+    """conditions キーの有無で単一条件か条件グループかを判別する（両方の型を試行する検証を避ける）"""
+    if isinstance(v, dict):
+        return 'group' if 'conditions' in v else 'single'
+    return 'group' if isinstance(v, ConditionGroup) else 'single'
+
+RuleCondition = Annotated[
+    Union[Annotated[Condition, Tag('single')], Annotated[ConditionGroup, Tag('group')]],
+    Discriminator(_condition_kind),
+]
+
 # --- Action ---
 class ResizeTo(BaseSettingsModel):
     width: Union[str, int, None] = Field(None, validation_alias=AliasChoices('w', 'width'))
@@ -53,7 +64,7 @@ class Action(BaseSettingsModel):
 # --- Rule ---
 class Rule(BaseSettingsModel):
     name: str
-    condition: Union[Condition, ConditionGroup]
+    condition: RuleCondition
     action: Action
 
 # --- Ignore ---
@@ -63,6 +74,8 @@ class Ignore(BaseSettingsModel):
     conditions: List[Condition]
 
 # --- Global ---
+_MONITOR_KEY_RE = re.compile(r'^monitor_[1-9]\d*$')
+
 class GlobalSettings(BaseSettingsModel):
     log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
     apply_on_startup: bool = True
@@ -76,7 +89,7 @@ class GlobalSettings(BaseSettingsModel):
     @classmethod
     def validate_monitor_offsets(cls, v: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
         for key in v.keys():
-            if key != 'default' and not re.match(r'^monitor_[1-9]\d*$', key):
+            if key != 'default' and not _MONITOR_KEY_RE.match(key):
                 raise ValueError(f"Invalid key in monitor_offsets: '{key}'. Keys must be 'default' or 'monitor_N' where N is a number greater than 0.")
         return v
 